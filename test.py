@@ -1,7 +1,26 @@
+import io
 import os
+import copy
+import json
 import unittest
 import shutil
-from sourcecontrol import DVC  # Assuming this is the module implementing the system.
+import hashlib
+import time
+from unittest import mock
+import sourcecontrol
+from sourcecontrol import DVC, CHUNK_SIZE, fast_copy, hash_file, histogram_diff  # Assuming this is the module implementing the system.
+
+
+class CountingLine(str):
+    """A line that counts how often it is compared, to bound diff work without timing it."""
+    comparisons = 0
+
+    def __eq__(self, other):
+        CountingLine.comparisons += 1
+        return str.__eq__(self, other)
+
+    __hash__ = str.__hash__
+
 
 class TestDVC(unittest.TestCase):
 
@@ -38,7 +57,142 @@ class TestDVC(unittest.TestCase):
 
         metadata = self.dvc.load_metadata()
         branch = metadata["branches"]["main"]
-        self.assertTrue(any('test_file.txt' in commit['files'] for commit in branch))
+        self.assertTrue(any('test_file.txt' in metadata['commits'][c]['files'] for c in branch))
+
+    def test_add_deduplicates_objects(self):
+        """Test if identical content is stored once in the fanned-out object store."""
+        with open(self.file_path, 'w') as f:
+            f.write('Hello DVC!')
+        self.dvc.add(self.file_path)
+
+        file_hash = self.dvc.load_metadata()['staging']['test_file.txt']
+        obj_path = os.path.join(self.repo_dir, '.dvc', 'objects', file_hash[:2], file_hash[2:])
+        with open(obj_path) as f:
+            self.assertEqual(f.read(), 'Hello DVC!')
+
+        with mock.patch.object(sourcecontrol, 'fast_copy') as copy:
+            self.dvc.add(self.file_path)
+        copy.assert_not_called()
+
+    def test_changed_files_are_stored_as_deltas(self):
+        """Test if a small edit to a committed file is stored as a delta that reads back exactly."""
+        lines = [f'line {i}\n' for i in range(2000)]
+        versions = []
+        with mock.patch.object(sourcecontrol, 'MAX_DELTA_CHAIN', 2):
+            for n in range(4):
+                lines[n * 100] = f'changed {n}\n'
+                versions.append(''.join(lines).encode())
+                with open(self.file_path, 'wb') as f:
+                    f.write(versions[-1])
+                self.dvc.add(self.file_path)
+                self.dvc.commit(f'Version {n}')
+
+        hashes = [hashlib.sha1(v).hexdigest() for v in versions]
+        full = [os.path.exists(self.dvc.object_path(h)) for h in hashes]
+        self.assertEqual(full, [True, False, False, True])
+        for data, file_hash in zip(versions, hashes):
+            self.assertEqual(self.dvc.read_object(file_hash), data)
+
+    def test_delta_encoding_scales_linearly(self):
+        """Test if adding a heavily edited large file stays fast and reads back exactly."""
+        # Alternating edits over 200k lines: ~0.5 s linear, hours if quadratic
+        lines = [f'line {i} of the data file\n' for i in range(200000)]
+        with open(self.file_path, 'w') as f:
+            f.writelines(lines)
+        self.dvc.add(self.file_path)
+        self.dvc.commit('Base')
+
+        edited = ''.join(f'changed {i}\n' if i % 2 else line for i, line in enumerate(lines)).encode()
+        with open(self.file_path, 'wb') as f:
+            f.write(edited)
+        self.dvc.add(self.file_path)
+
+        file_hash = hashlib.sha1(edited).hexdigest()
+        self.assertTrue(os.path.exists(self.dvc.object_path(file_hash) + '.delta'))
+        self.assertEqual(self.dvc.read_object(file_hash), edited)
+
+    def test_add_many(self):
+        """Test if a batch of files is staged with one log record, skipping ignored ones."""
+        with open(os.path.join(self.repo_dir, '.dvc', '.dvcignore'), 'w') as f:
+            f.write('skip.txt\n')
+        paths = [os.path.join(self.repo_dir, name) for name in ('a.txt', 'b.txt', 'c.txt', 'skip.txt')]
+        for path in paths:
+            with open(path, 'w') as f:
+                f.write('same content')
+
+        self.dvc.add_many(paths)
+
+        metadata = DVC(self.repo_dir).load_metadata()
+        self.assertEqual(set(metadata['staging']), {'a.txt', 'b.txt', 'c.txt'})
+        self.assertEqual(self.dvc.read_object(metadata['staging']['a.txt']), b'same content')
+        self.assertEqual(os.path.getsize(os.path.join(self.repo_dir, '.dvc', 'log.bin')),
+                         sourcecontrol.LOG_HEADER.size + len(sourcecontrol.dump_json({"files": metadata['staging']})))
+
+    def test_add_rejects_paths_outside_repository(self):
+        """Test if a sibling directory sharing the repository's name prefix is rejected."""
+        sibling_dir = self.repo_dir + '_evil'
+        os.mkdir(sibling_dir)
+        self.addCleanup(shutil.rmtree, sibling_dir)
+        sibling_file = os.path.join(sibling_dir, 'file.txt')
+        with open(sibling_file, 'w') as f:
+            f.write('outside')
+
+        with self.assertRaises(ValueError):
+            self.dvc.add(sibling_file)
+
+    def test_add_skips_rehashing_unchanged_files(self):
+        """Test if re-adding a file whose stat is unchanged reuses the previous hash."""
+        with open(self.file_path, 'w') as f:
+            f.write('Version 1')
+        os.utime(self.file_path, ns=(10**18, 10**18))  # settled, well outside the racy window
+        self.dvc.add(self.file_path)
+
+        with mock.patch.object(sourcecontrol, 'hash_file') as hasher:
+            self.dvc.add(self.file_path)
+        hasher.assert_not_called()
+
+        with open(self.file_path, 'w') as f:
+            f.write('Version 2')
+        self.dvc.add(self.file_path)
+        self.assertEqual(self.dvc.load_metadata()['staging']['test_file.txt'],
+                         hashlib.sha1(b'Version 2').hexdigest())
+
+        # An in-place rewrite of the same size with its mtime put back still changes the ctime
+        with open(self.file_path, 'w') as f:
+            f.write('AAAA')
+        os.utime(self.file_path, ns=(10**18, 10**18))
+        self.dvc.add(self.file_path)
+        time.sleep(0.02)  # let a coarse filesystem clock tick so the ctime moves
+        with open(self.file_path, 'r+') as f:
+            f.write('BBBB')
+        os.utime(self.file_path, ns=(10**18, 10**18))
+        self.dvc.add(self.file_path)
+        self.assertEqual(self.dvc.load_metadata()['staging']['test_file.txt'],
+                         hashlib.sha1(b'BBBB').hexdigest())
+
+    def test_fanout_directory_created_once(self):
+        """Test if objects sharing a hash prefix create their fan-out directory only once."""
+        seen = {}
+        n = 0
+        while True:
+            content = f'content {n}'.encode()
+            prefix = hashlib.sha1(content).hexdigest()[:2]
+            if prefix in seen:
+                break
+            seen[prefix] = content
+            n += 1
+        paths = [os.path.join(self.repo_dir, name) for name in ('a.txt', 'b.txt')]
+        for path, data in zip(paths, (seen[prefix], content)):
+            with open(path, 'wb') as f:
+                f.write(data)
+
+        with mock.patch.object(sourcecontrol.os, 'makedirs', wraps=os.makedirs) as makedirs:
+            for path in paths:
+                self.dvc.add(path)
+        makedirs.assert_called_once()
+        for path in paths:
+            with open(path, 'rb') as f:
+                self.assertEqual(self.dvc.read_object(hash_file(path)), f.read())
 
     def test_view_commit_history(self):
         """Test if commit history can be viewed."""
@@ -58,12 +212,136 @@ class TestDVC(unittest.TestCase):
         branch = metadata["branches"]["main"]
         self.assertEqual(len(branch), 2)
 
+    def test_commit_ids_chain_parents(self):
+        """Test if identical commits made at the same instant still get distinct ids."""
+        with open(self.file_path, 'w') as f:
+            f.write('Hello DVC!')
+
+        frozen = mock.Mock(wraps=sourcecontrol.datetime)
+        frozen.now.return_value = sourcecontrol.datetime(2024, 1, 1)
+        with mock.patch.object(sourcecontrol, 'datetime', frozen):
+            for _ in range(2):
+                self.dvc.add(self.file_path)
+                self.dvc.commit('Same message')
+
+        metadata = self.dvc.load_metadata()
+        first, second = metadata['branches']['main']
+        self.assertNotEqual(first, second)
+        self.assertEqual(metadata['commits'][second]['parent'], first)
+
+    def test_log_output(self):
+        """Test if log prints every commit, newest first, in the usual format."""
+        commit_ids = []
+        for message in ('First', 'Second'):
+            with open(self.file_path, 'w') as f:
+                f.write(message)
+            self.dvc.add(self.file_path)
+            commit_ids.append(self.dvc.commit(message))
+
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+            self.dvc.log()
+
+        commits = self.dvc.load_metadata()['commits']
+        expected = ''.join(
+            f"Commit: {c}\nMessage: {commits[c]['message']}\nTime: {commits[c]['timestamp']}\nParent: {commits[c]['parent']}\n\n"
+            for c in reversed(commit_ids)
+        )
+        self.assertEqual(out.getvalue(), expected)
+
     def test_branch_creation(self):
         """Test if branches can be created."""
         self.dvc.branch('new-branch')
         metadata = self.dvc.load_metadata()
         self.assertIn('new-branch', metadata['branches'])
 
+    def test_branches_share_commit_objects(self):
+        """Test if branching copies commit ids only, so each commit is serialized once."""
+        with open(self.file_path, 'w') as f:
+            f.write('Hello DVC!')
+        self.dvc.add(self.file_path)
+        commit_id = self.dvc.commit('Shared commit')
+        for name in ('b1', 'b2', 'b3'):
+            self.dvc.branch(name)
+
+        metadata = self.dvc.load_metadata()
+        self.assertEqual(metadata['branches'],
+                         {name: [commit_id] for name in ('main', 'b1', 'b2', 'b3')})
+
+        self.dvc.save_metadata(metadata)
+        with open(os.path.join(self.repo_dir, '.dvc', 'metadata.json')) as f:
+            self.assertEqual(f.read().count('Shared commit'), 1)
+
+    def test_legacy_metadata_is_migrated(self):
+        """Test if snapshots with commit dicts inside branch lists are still readable."""
+        commit = {"id": "c1", "message": "Old", "timestamp": "t", "files": {"a.txt": "h"}, "parent": None}
+        legacy = {"branches": {"main": [commit], "dev": [commit]}, "current_branch": "main", "head": "c1"}
+        with open(os.path.join(self.repo_dir, '.dvc', 'metadata.json'), 'w') as f:
+            json.dump(legacy, f)
+
+        metadata = DVC(self.repo_dir).load_metadata()
+        self.assertEqual(metadata['commits'], {"c1": commit})
+        self.assertEqual(metadata['branches'], {"main": ["c1"], "dev": ["c1"]})
+        self.assertEqual(metadata['branches_tip_files'], {"main": {"a.txt": "h"}, "dev": {"a.txt": "h"}})
+
+    def test_legacy_objects_are_readable(self):
+        """Test if objects stored as objects/<hash>/<file name> still diff and serve as delta bases."""
+        lines = [f'line {i}\n' for i in range(2000)]
+        old_data = ''.join(lines).encode()
+        old_hash = hashlib.sha1(old_data).hexdigest()
+        legacy_dir = os.path.join(self.repo_dir, '.dvc', 'objects', old_hash)
+        os.makedirs(legacy_dir)
+        with open(os.path.join(legacy_dir, 'test_file.txt'), 'wb') as f:
+            f.write(old_data)
+        commit = {"id": "c1", "message": "Old", "timestamp": "t", "files": {"test_file.txt": old_hash}, "parent": None}
+        legacy = {"branches": {"main": [commit]}, "current_branch": "main", "head": "c1"}
+        with open(os.path.join(self.repo_dir, '.dvc', 'metadata.json'), 'w') as f:
+            json.dump(legacy, f)
+
+        dvc = DVC(self.repo_dir)
+        self.assertTrue(dvc.has_object(old_hash))
+        lines[1000] = 'changed\n'
+        new_data = ''.join(lines).encode()
+        with open(self.file_path, 'wb') as f:
+            f.write(new_data)
+        dvc.add(self.file_path)
+        new_commit = dvc.commit('New')
+
+        new_hash = hashlib.sha1(new_data).hexdigest()
+        self.assertTrue(os.path.exists(dvc.object_path(new_hash) + '.delta'))
+        self.assertEqual(dvc.read_object(new_hash), new_data)
+        self.assertIn('+changed', dvc.diff('c1', new_commit))
+
+    def test_unknown_metadata_keys_are_kept(self):
+        """Test if keys the code does not know about survive loading and compaction."""
+        with open(self.file_path, 'w') as f:
+            f.write('Hello DVC!')
+        self.dvc.add(self.file_path)
+        commit_id = self.dvc.commit('Initial commit')
+        metadata = self.dvc.load_metadata()
+        metadata['remotes'] = {'origin': '/srv/repo'}
+        metadata['commits'][commit_id]['author'] = 'someone'
+        self.dvc.save_metadata(metadata)
+
+        self.dvc.branch('new-branch')
+        self.dvc.save_metadata(DVC(self.repo_dir).load_metadata())
+        reloaded = DVC(self.repo_dir).load_metadata()
+        self.assertEqual(reloaded['remotes'], {'origin': '/srv/repo'})
+        self.assertEqual(reloaded['commits'][commit_id]['author'], 'someone')
+
+    @unittest.skipUnless(sourcecontrol.msgspec, 'msgspec is not installed')
+    def test_msgspec_snapshot_decoder(self):
+        """Test if snapshots go through msgspec when installed and decode like the generic loader."""
+        self.dvc.branch('new-branch')
+        self.dvc.save_metadata(self.dvc.load_metadata())
+        with open(os.path.join(self.repo_dir, '.dvc', 'metadata.json'), 'rb') as f:
+            data = f.read()
+
+        with mock.patch.object(sourcecontrol, 'metadata_decoder',
+                               wraps=sourcecontrol.metadata_decoder) as decoder:
+            metadata = DVC(self.repo_dir).load_metadata()
+        decoder.decode.assert_called_once()
+        self.assertEqual(metadata, {k: v for k, v in json.loads(data).items() if k != 'seq'})
+
     def test_branch_merge(self):
         """Test if branches can be merged and conflicts detected."""
         self.dvc.branch('new-branch')
@@ -89,7 +367,30 @@ class TestDVC(unittest.TestCase):
             self.assertIn(self.file_path, conflicts)
         else:
             branch = metadata['branches']['main']
-            self.assertTrue(any('merge-' in commit['id'] for commit in branch))
+            self.assertTrue(any(c.startswith('merge-') for c in branch))
+
+    def test_merge_without_conflicts(self):
+        """Test if a clean merge combines the tip files of both branches."""
+        other_path = os.path.join(self.repo_dir, 'other.txt')
+        with open(self.file_path, 'w') as f:
+            f.write('Hello from main!')
+        self.dvc.add(self.file_path)
+        self.dvc.commit('Main commit')
+
+        self.dvc.branch('new-branch')
+        self.dvc.checkout('new-branch')
+        with open(other_path, 'w') as f:
+            f.write('Hello from branch!')
+        self.dvc.add(other_path)
+        self.dvc.commit('Branch commit')
+
+        self.dvc.checkout('main')
+        self.assertIsNone(self.dvc.merge('new-branch'))
+
+        metadata = self.dvc.load_metadata()
+        tip = metadata['branches_tip_files']['main']
+        self.assertEqual(set(tip), {'test_file.txt', 'other.txt'})
+        self.assertEqual(metadata['commits'][metadata['head']]['files'], tip)
 
     def test_diff_between_commits(self):
         """Test if diffs between commits can be viewed."""
@@ -105,10 +406,67 @@ class TestDVC(unittest.TestCase):
         self.dvc.add(self.file_path)
         commit2 = self.dvc.commit('Commit 2')
 
-        diff = self.dvc.diff('main', 'main')  # Assuming diff is within the same branch for simplicity
+        diff = self.dvc.diff(commit1, commit2)
         self.assertIn('Version 1', diff)
         self.assertIn('Version 2', diff)
 
+    def test_histogram_diff_matches_lines(self):
+        """Test if histogram_diff anchors on unique lines and covers every common line."""
+        old = ['a', 'b', 'x', 'c', 'd', 'x', 'e']
+        new = ['a', 'x', 'c', 'd', 'y', 'x', 'e', 'f']
+        blocks = histogram_diff(old, new)
+
+        for i, j, n in blocks:
+            self.assertEqual(old[i:i + n], new[j:j + n])
+        self.assertEqual(sum(n for _, _, n in blocks), 6)
+        self.assertEqual(histogram_diff(['a'] * 100, ['a'] * 99 + ['b']), [(0, 0, 99)])
+
+    def test_histogram_diff_repetitive_lines(self):
+        """Test if edits among lines too common to anchor on are still found one by one."""
+        rows = ['0,0,0'] * 1000
+        edited = list(rows)
+        edited[100] = '1,0,0'
+        edited[800] = '0,2,0'
+
+        self.assertEqual(histogram_diff(rows, edited), [(0, 0, 100), (101, 101, 699), (801, 801, 199)])
+        blocks = histogram_diff(rows, rows[:300] + rows[301:] + ['0,0,1'])
+        self.assertEqual(sum(n for _, _, n in blocks), 999)
+
+    def test_histogram_diff_scales_linearly(self):
+        """Test if swapped or repetitive lines do not make histogram_diff quadratic."""
+        old = [CountingLine(f'line {i}') for i in range(20000)]
+        swapped = [old[i ^ 1] for i in range(len(old))]
+        repetitive = [CountingLine(f'x{i % 7}') for i in range(20000)]
+
+        CountingLine.comparisons = 0
+        blocks = histogram_diff(old, swapped)
+        histogram_diff(repetitive, repetitive[3:] + repetitive[:3])
+        self.assertLess(CountingLine.comparisons, 100 * len(old))  # quadratic would be ~len(old) ** 2
+        self.assertEqual(sum(n for _, _, n in blocks), 10000)
+
+    def test_diff_skips_binary_and_large_files(self):
+        """Test if diff reports binary or oversized files instead of printing their lines."""
+        with open(self.file_path, 'wb') as f:
+            f.write(b'\0binary 1')
+        self.dvc.add(self.file_path)
+        commit1 = self.dvc.commit('Binary 1')
+        with open(self.file_path, 'wb') as f:
+            f.write(b'\0binary 2')
+        self.dvc.add(self.file_path)
+        commit2 = self.dvc.commit('Binary 2')
+        self.assertIn('Binary files differ', self.dvc.diff(commit1, commit2))
+
+        commits = []
+        for text in ('large text 1', 'large text 2'):
+            with open(self.file_path, 'w') as f:
+                f.write(text)
+            self.dvc.add(self.file_path)
+            commits.append(self.dvc.commit(text))
+        with mock.patch.object(sourcecontrol, 'MAX_DIFF_SIZE', 4):
+            diff = self.dvc.diff(*commits)
+        self.assertIn('Files too large to show line changes', diff)
+        self.assertNotIn('large text', diff)
+
     def test_ignore_files(self):
         """Test if ignored files are not tracked."""
         with open(self.ignore_file, 'w') as f:
@@ -122,6 +480,122 @@ class TestDVC(unittest.TestCase):
         metadata = self.dvc.load_metadata()
         self.assertNotIn('ignored_file.txt', metadata.get('staging', {}))
 
+    def test_metadata_log_replay_and_compaction(self):
+        """Test if logged mutations survive a reload, compaction and a torn tail record."""
+        with open(self.file_path, 'w') as f:
+            f.write('Hello DVC!')
+
+        self.dvc.add(self.file_path)
+        self.dvc.commit('Initial commit')
+        self.dvc.branch('new-branch')
+        expected = self.dvc.load_metadata()
+
+        log_file = os.path.join(self.repo_dir, '.dvc', 'log.bin')
+        with open(log_file, 'ab') as f:
+            f.write(b'\x02\x00')  # partial header left by a crash
+        size = os.path.getsize(log_file)
+        self.assertEqual(DVC(self.repo_dir).load_metadata(), expected)
+        self.assertEqual(os.path.getsize(log_file), size)  # readers never truncate
+
+        writer = DVC(self.repo_dir)
+        writer.branch('other-branch')
+        self.assertIn('other-branch', DVC(self.repo_dir).load_metadata()['branches'])
+
+        with mock.patch.object(sourcecontrol, 'COMPACT_EVERY', 1):
+            self.dvc.checkout('new-branch')
+        self.assertEqual(os.path.getsize(log_file), 0)
+        self.assertEqual(DVC(self.repo_dir).load_metadata()['current_branch'], 'new-branch')
+
+    def test_metadata_cache_sees_other_writers(self):
+        """Test if cached metadata is refreshed after another instance writes."""
+        self.assertEqual(self.dvc.load_metadata()['current_branch'], 'main')
+
+        other = DVC(self.repo_dir)
+        other.branch('new-branch')
+        other.checkout('new-branch')
+
+        self.assertEqual(self.dvc.load_metadata()['current_branch'], 'new-branch')
+
+    def test_snapshot_write_is_atomic(self):
+        """Test if a snapshot write that fails midway leaves the previous snapshot intact."""
+        meta_file = os.path.join(self.repo_dir, '.dvc', 'metadata.json')
+        with open(meta_file, 'rb') as f:
+            before = f.read()
+
+        self.dvc.branch('new-branch')
+        with mock.patch.object(sourcecontrol.os, 'fsync', side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.dvc.save_metadata(self.dvc.load_metadata())
+
+        with open(meta_file, 'rb') as f:
+            self.assertEqual(f.read(), before)
+        self.assertIn('new-branch', DVC(self.repo_dir).load_metadata()['branches'])
+
+    def test_save_metadata_replaces_cached_state(self):
+        """Test if saving a copied dict is what the same instance loads afterwards."""
+        metadata = copy.deepcopy(self.dvc.load_metadata())
+        metadata['current_branch'] = 'dev'
+        self.dvc.save_metadata(metadata)
+
+        self.assertEqual(self.dvc.load_metadata()['current_branch'], 'dev')
+
+    def test_hash_file_streams_large_files(self):
+        """Test if hashing a multi-chunk file matches a one-shot SHA-1."""
+        data = os.urandom(CHUNK_SIZE * 2 + 123)
+        with open(self.file_path, 'wb') as f:
+            f.write(data)
+
+        self.assertEqual(hash_file(self.file_path), hashlib.sha1(data).hexdigest())
+
+    def test_fast_copy(self):
+        """Test if fast_copy reproduces large and empty files exactly."""
+        copy_path = os.path.join(self.repo_dir, 'copy.bin')
+        for data in (os.urandom(CHUNK_SIZE + 17), b''):
+            with open(self.file_path, 'wb') as f:
+                f.write(data)
+
+            fast_copy(self.file_path, copy_path)
+            with open(copy_path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(hash_file(copy_path), hashlib.sha1(data).hexdigest())
+
+    def test_clone_copies_objects_and_metadata(self):
+        """Test if a clone holds the same metadata and objects, without temporaries."""
+        with open(self.file_path, 'w') as f:
+            f.write('Hello DVC!')
+        self.dvc.add(self.file_path)
+        commit_id = self.dvc.commit('Initial commit')
+        file_hash = self.dvc.load_metadata()['commits'][commit_id]['files']['test_file.txt']
+        open(self.dvc.object_path(file_hash) + '.tmp', 'w').close()
+
+        clone_dir = os.path.join(self.repo_dir, 'clone')
+        self.dvc.clone(clone_dir)
+
+        with open(os.path.join(clone_dir, 'objects', file_hash[:2], file_hash[2:])) as f:
+            self.assertEqual(f.read(), 'Hello DVC!')
+        self.assertFalse(os.path.exists(os.path.join(clone_dir, 'objects', file_hash[:2], file_hash[2:] + '.tmp')))
+        for name in ('metadata.json', 'log.bin'):
+            with open(os.path.join(self.repo_dir, '.dvc', name), 'rb') as f1, \
+                    open(os.path.join(clone_dir, name), 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+    def test_ignore_glob_patterns(self):
+        """Test if .dvcignore glob patterns are honoured and picked up when the file changes."""
+        ignore_path = os.path.join(self.repo_dir, '.dvc', '.dvcignore')
+        with open(ignore_path, 'w') as f:
+            f.write('*.tmp\nexact.txt\n')
+        paths = [os.path.join(self.repo_dir, name) for name in ('a.tmp', 'exact.txt', 'keep.txt')]
+        for path in paths:
+            with open(path, 'w') as f:
+                f.write(path)
+
+        self.dvc.add_many(paths)
+        self.assertEqual(set(self.dvc.load_metadata()['staging']), {'keep.txt'})
+
+        os.remove(ignore_path)
+        self.dvc.add_many(paths)
+        self.assertEqual(set(self.dvc.load_metadata()['staging']), {'a.tmp', 'exact.txt', 'keep.txt'})
+
     def test_cloning_repository(self):
         """Test if repository can be cloned."""
         clone_dir = 'cloned_repo'